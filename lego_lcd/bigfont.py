@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Big characters that are two rows tall, drawn with the custom characters of the LCD. Fonts are
+compiled into per-row lookup tables so that a whole string is rendered into complete rows in one
+pass and each row can be written to the LCD with a single write. On 4-row LCDs two lines of big
+characters can be shown.
+"""
+
+__all__ = ["BigFont", "BIGNUM"]
+
+
+class BigFont:
+    """
+    A font of big characters. The glyphs are the custom character data (up to 8) and chars maps
+    each character to its rows (each a bytes object of the same width for all rows). The
+    characters in the rows are typically custom characters 0-7 but can be any character of the
+    LCD. Characters not in the font are rendered as the default character.
+    """
+    def __init__(self, glyphs, chars: dict, default: str = ' '):
+        if len(glyphs) > 8: raise ValueError('A font can have at most 8 glyphs')
+        self.glyphs = tuple(bytes(g) for g in glyphs)
+        chars = {(ord(c) if isinstance(c, str) else c): rows for c, rows in chars.items()}
+        blank = chars[ord(default)]
+        self.height = len(blank)
+        if any(len(rows) != self.height or len(set(map(len, rows))) != 1 for rows in chars.values()):
+            raise ValueError('All characters must have the same number of rows and a single width')
+        self.tables = tuple(tuple(chars.get(c, blank)[i] for c in range(256)) for i in range(self.height))
+        # Fonts with characters that are 1 wide can be rendered with bytes.translate()
+        self.__trans = (tuple(b''.join(table) for table in self.tables)
+                        if all(len(rows[0]) == 1 for rows in chars.values()) else None)
+
+    def load(self, lcd) -> None:
+        """Load the glyphs into the custom characters of the LCD."""
+        lcd.set_custom_chars(*self.glyphs)
+
+    def render(self, text) -> list[bytes]:
+        """Render the text into a list of rows. The text is bytes or an ASCII string."""
+        if isinstance(text, str): text = text.encode('ascii', 'replace')
+        if self.__trans is not None: return [text.translate(trans) for trans in self.__trans]
+        return [b''.join(map(table.__getitem__, text)) for table in self.tables]
+
+    def render_rows(self, lines, width: int, justify: str = 'left') -> list[bytes]:
+        """
+        Render several lines of text one after another into a list of rows each exactly width
+        characters wide. Each line is justified as specified ('left', 'center', or 'right') and
+        truncated if too long.
+        """
+        justify = bytes.center if justify == 'center' else (bytes.rjust if justify == 'right' else bytes.ljust)
+        return [justify(row, width)[:width] for line in lines for row in self.render(line)]
+
+    def write(self, lcd, pos, text) -> None:
+        """Write the text at the position (row, col) with a single write per row."""
+        for i, row in enumerate(self.render(text)):
+            lcd.write_at((pos[0] + i, pos[1]), row)
+
+    def write_lines(self, lcd, *lines, justify: str = 'left') -> None:
+        """
+        Write lines of text filling the LCD with a single write per row. A 2-row LCD shows one
+        line and a 4-row LCD shows two lines. Unlike lcd.write_lines() the LCD is not cleared.
+        """
+        nc, nr = lcd.dims
+        rows = self.render_rows(lines[:nr // self.height], nc, justify)
+        rows += [b' '*nc] * (nr - len(rows))
+        for i, row in enumerate(rows):
+            lcd.write_at((i, 0), row)
+
+
+# The big numbers used by the clock along with a few other characters that can be made with them
+BIGNUM = BigFont((
+    b'\x03\x03\x03\x03\x03\x03\x03\x03', #   |
+    b'\x1F\x1F\x1B\x1B\x1B\x1B\x1B\x1B', # |^|
+    b'\x1B\x1B\x1B\x1B\x1B\x1B\x1F\x1F', # |_|
+    b'\x1F\x1F\x03\x03\x03\x03\x03\x03', #  ^|
+    b'\x1F\x1F\x18\x18\x18\x18\x18\x18', # |^
+    b'\x1F\x1F\x18\x18\x18\x18\x1F\x1F', # |^_
+    b'\x1F\x1F\x1B\x1B\x1B\x1B\x1F\x1F', # |^_|
+    b'\x1F\x1F\x03\x03\x03\x03\x1F\x1F', #  _^|
+), {
+    '0': (b'\x01', b'\x02'), '1': (b'\x00', b'\x00'), '2': (b'\x03', b'\x05'),
+    '3': (b'\x03', b'\x07'), '4': (b'\x02', b'\x00'), '5': (b'\x04', b'\x07'),
+    '6': (b'\x04', b'\x06'), '7': (b'\x03', b'\x00'), '8': (b'\x06', b'\x02'),
+    '9': (b'\x06', b'\x00'),
+    ' ': (b' ', b' '), ':': (b'\xCD', b'\xCD'), '.': (b' ', b'.'), '-': (b'_', b' '),
+    'O': (b'\x01', b'\x02'), 'I': (b'\x00', b'\x00'), 'Z': (b'\x03', b'\x05'),
+    'S': (b'\x04', b'\x07'), 'G': (b'\x04', b'\x02'), 'J': (b'\x00', b'\x02'),
+    'B': (b'\x06', b'\x02'),
+})
@@ -3,41 +3,28 @@
 from time import time, sleep
 from datetime import datetime
 
+from .bigfont import BigFont, BIGNUM
+
 show24h = False
 weekdays = (b'Mon', b'Tue', b'Wed', b'Thu', b'Fri', b'Sat', b'Sun')
 months = (b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun',
           b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec')
 
-def write_day(lcd, dt: datetime, bignum_digits: tuple[bytes]):
-    """Write the day of the week and the date to the LCD."""
-    lcd.write_at((0,1), b'%3s %02d'%(weekdays[dt.weekday()], dt.day))
-    lcd.write_at((1,0), b'%3s %4d'%(months[dt.month-1], dt.year))
-
-
-def write_hour(lcd, h: int, bignum_digits: tuple[bytes]):
-    """Write the hour to the LCD along with am/pm."""
-    write_2_digit(lcd, 10, h if show24h else (12 if h == 0 else (h-12*(h>12))), bignum_digits, False)
-    lcd.write_at((1,18), (b'  ' if show24h else (b'am' if h < 12 else b'pm')))
-
-
-def write_min(lcd, m: int, bignum_digits: tuple[bytes]):
-    """Write the minutes to the LCD."""
-    write_2_digit(lcd, 13, m, bignum_digits)
+def render_rows(dt: datetime, font: BigFont) -> list[bytes]:
+    """Render the two rows of the clock with the date, big time, and am/pm."""
+    h = dt.hour if show24h else (12 if dt.hour == 0 else (dt.hour-12*(dt.hour>12)))
+    big = font.render(b'%2d:%02d:%02d'%(h, dt.minute, dt.second))
+    ampm = b'  ' if show24h else (b'am' if dt.hour < 12 else b'pm')
+    return [b' %3s %02d   '%(weekdays[dt.weekday()], dt.day) + big[0] + b'  ',
+            b'%3s %4d  '%(months[dt.month-1], dt.year) + big[1] + ampm]
 
 
-def write_sec(lcd, s: int, bignum_digits: tuple[bytes]):
-    """Write the seconds to the LCD."""
-    write_2_digit(lcd, 16, s, bignum_digits)
-
-
-def write_2_digit(lcd, column: int, value: int, bignum_digits: tuple[bytes],
-                  leading_zero: bool = True):
-    """Write a 2-digit number to the LCD using big numbers."""
-    q, r = divmod(value, 10)
-    leading_space = q == 0 and not leading_zero
-    for i in range(len(bignum_digits)):
-        s = (b' ' if leading_space else bignum_digits[i][q:q+1]) + bignum_digits[i][r:r+1]
-        lcd.write_at((i, column), s)
+def write_changed(lcd, row: int, old: bytes, new: bytes):
+    """Write the part of a row that changed to the LCD with a single write."""
+    if old == new: return
+    start = next(i for i, (a, b) in enumerate(zip(old, new)) if a != b)
+    end = len(new) - next(i for i, (a, b) in enumerate(zip(reversed(old), reversed(new))) if a != b)
+    lcd.write_at((row, start), new[start:end])
 
 
 def run_clock(lcd = None):
@@ -46,45 +33,20 @@ def run_clock(lcd = None):
         from .lcd_helper import lcd_setup
         lcd = lcd_setup(1.0, 0.4)
 
-    bignums = load_bignum(lcd)
-
+    BIGNUM.load(lcd)
     lcd.clear()
-    lcd.write_at((0,12), b'\xCD'); lcd.write_at((1,12), b'\xCD')
-    lcd.write_at((0,15), b'\xCD'); lcd.write_at((1,15), b'\xCD')
 
-    old = datetime.now()
-    write_day(lcd, old, bignums)
-    write_hour(lcd, old.hour, bignums)
-    write_min(lcd, old.minute, bignums)
+    shown = [b' '*20] * 2 # the clock is laid out for a 20x2 LCD
     while True:
-        x = datetime.now()
-        if old.day != x.day or old.month != x.month or old.year != x.year: write_day(lcd, x, bignums)
-        if old.hour != x.hour: write_hour(lcd, x.hour, bignums)
-        if old.minute != x.minute: write_min(lcd, x.minute, bignums)
-        write_sec(lcd, x.second, bignums)
-        old = x
+        rows = render_rows(datetime.now(), BIGNUM)
+        for i, (old, new) in enumerate(zip(shown, rows)):
+            write_changed(lcd, i, old, new)
+        shown = rows
+        lcd.scrub() # repair any corruption a little at a time while idle
         slp = 0.999-time()%1 # not 1.0 - x since it seems it takes ~1 ms to just get to the top of the loop
         if slp > 0: sleep(slp)
 
 
-def load_bignum(lcd) -> tuple[bytes]:
-    """Load the big numbers into the LCD and return the digits."""
-    lcd.set_custom_chars(
-        b'\x03\x03\x03\x03\x03\x03\x03\x03', #   |
-        b'\x1F\x1F\x1B\x1B\x1B\x1B\x1B\x1B', # |^|
-        b'\x1B\x1B\x1B\x1B\x1B\x1B\x1F\x1F', # |_|
-        b'\x1F\x1F\x03\x03\x03\x03\x03\x03', #  ^|
-        b'\x1F\x1F\x18\x18\x18\x18\x18\x18', # |^
-        b'\x1F\x1F\x18\x18\x18\x18\x1F\x1F', # |^_
-        b'\x1F\x1F\x1B\x1B\x1B\x1B\x1F\x1F', # |^_|
-        b'\x1F\x1F\x03\x03\x03\x03\x1F\x1F'  #  _^|
-    )
-    return (
-        b'\x01\x00\x03\x03\x02\x04\x04\x03\x06\x06',
-        b'\x02\x00\x05\x07\x00\x07\x06\x00\x02\x00',
-    )
-
-
 def main():
     from .lcd_helper import lcd_setup
     from .wifi_connect import local_ip, run_captive_portal
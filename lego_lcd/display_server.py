@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+A display server that owns the LCD and lets several client processes share it over a Unix domain
+socket. Each client draws into its own layers and the server composites all of the layers by
+priority (higher layers cover lower ones) and only writes the cells of the LCD that changed.
+
+The protocol is a stream of messages each with a 6 byte header of op, layer, row, col, and a
+16-bit little-endian length followed by the payload:
+
+- WRITE: write the payload (length bytes) at row, col in the layer
+- ERASE: make length cells at row, col in the layer transparent again (no payload)
+- CLEAR: make the entire layer transparent (no payload)
+- CHARS: set custom characters starting at the character number given as row, the payload is
+  8 bytes for each character (custom characters are shared by all clients)
+
+When a client connects the server sends 2 bytes with the width and height of the LCD. Each client
+is limited to a number of messages per second. Messages beyond that are not read until the client
+is allowed to send more, which eventually blocks the client.
+"""
+
+import os, socket, struct, selectors, argparse
+from time import monotonic
+
+__all__ = ["DisplayServer", "DisplayClient", "DEFAULT_SOCKET"]
+
+DEFAULT_SOCKET = '/run/lego-lcd.sock'
+DEFAULT_RATE = 50.0 # messages per second
+DEFAULT_BURST = 20 # messages
+
+OP_WRITE, OP_ERASE, OP_CLEAR, OP_CHARS = 1, 2, 3, 4
+HEADER = struct.Struct('<BBBBH')
+SCRUB_INTERVAL = 1.0 # seconds between scrubs of the LCD while idle
+
+
+class _Client:
+    """The state of a client connected to the server."""
+    def __init__(self, sock: socket.socket, order: int, burst: int):
+        self.sock = sock
+        self.order = order  # clients that connected later are on top of others in the same layer
+        self.buffer = bytearray()
+        self.layers = {}  # layer -> (text, mask) of the entire LCD
+        self.tokens = float(burst)
+        self.time = monotonic()
+        self.reading = True
+
+
+class DisplayServer:
+    """
+    Server that owns the LCD and composites the layers drawn by clients connected to the socket
+    at the given path. Each client may send rate messages per second with bursts up to burst.
+    """
+    def __init__(self, lcd, path: str = DEFAULT_SOCKET,
+                 rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.lcd = lcd
+        self.nc, self.nr = lcd.dims
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        self.shown = [bytearray(b' '*self.nc) for _ in range(self.nr)]
+        self.clients = []
+        self.count = 0
+        self.dirty = False
+        lcd.clear()
+
+        if os.path.exists(path): os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen()
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+
+    def close(self) -> None:
+        """Disconnect all clients and stop listening."""
+        for client in list(self.clients): self.__drop(client)
+        self.selector.close()
+        self.sock.close()
+        if os.path.exists(self.path): os.unlink(self.path)
+
+    def __enter__(self): return self
+    def __exit__(self, *args): self.close()
+
+    def serve_forever(self) -> None:
+        """Serve clients until an error occurs. The LCD is scrubbed while idle."""
+        last_scrub = monotonic()
+        while True:
+            events = self.selector.select(self.__timeout())
+            for key, _ in events:
+                if key.data is None: self.__accept()
+                else: self.__receive(key.data)
+            for client in list(self.clients): self.__process(client)
+            if self.dirty: self.flush()
+            elif monotonic() - last_scrub >= SCRUB_INTERVAL:
+                self.lcd.scrub()
+                last_scrub = monotonic()
+
+    def __timeout(self) -> float:
+        """The time until the next client can send another message or the next scrub."""
+        waits = [(1 - client.tokens) / self.rate for client in self.clients if not client.reading]
+        return max(min(waits, default=SCRUB_INTERVAL), 0)
+
+    def __accept(self) -> None:
+        """Accept a new client and tell it the dimensions of the LCD."""
+        try:
+            sock, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        try:
+            sock.sendall(bytes((self.nc, self.nr)))
+        except OSError:
+            sock.close()  # the client already disconnected
+            return
+        self.count += 1
+        client = _Client(sock, self.count, self.burst)
+        self.clients.append(client)
+        self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def __drop(self, client: _Client) -> None:
+        """Disconnect a client, removing its layers."""
+        if client.reading: self.selector.unregister(client.sock)
+        client.sock.close()
+        self.clients.remove(client)
+        self.dirty |= bool(client.layers)
+
+    def __receive(self, client: _Client) -> None:
+        """Receive data from a client."""
+        try:
+            data = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if data: client.buffer += data
+        else: self.__drop(client)
+
+    def __process(self, client: _Client) -> None:
+        """
+        Process the complete messages from a client that it is allowed to send. If it has sent too
+        many messages, stop reading from it until it is allowed to send more.
+        """
+        now = monotonic()
+        client.tokens = min(client.tokens + (now - client.time) * self.rate, self.burst)
+        client.time = now
+        buffer = client.buffer
+        while client.tokens >= 1 and len(buffer) >= HEADER.size:
+            op, layer, row, col, n = HEADER.unpack_from(buffer)
+            size = HEADER.size + (n if op in (OP_WRITE, OP_CHARS) else 0)
+            if len(buffer) < size: break
+            try:
+                self.__handle(client, op, layer, row, col, n, bytes(buffer[HEADER.size:size]))
+            except ValueError:
+                self.__drop(client)  # protocol error
+                return
+            del buffer[:size]
+            client.tokens -= 1
+        throttled = client.tokens < 1 and len(buffer) >= HEADER.size
+        if throttled and client.reading: self.selector.unregister(client.sock)
+        elif not throttled and not client.reading: self.selector.register(client.sock, selectors.EVENT_READ, client)
+        client.reading = not throttled
+
+    def __handle(self, client: _Client, op: int, layer: int, row: int, col: int, n: int, data: bytes) -> None:
+        """Handle a single message from a client."""
+        if op == OP_CHARS:
+            if n % 8 or row + n // 8 > 8: raise ValueError('invalid custom characters')
+            self.lcd.set_custom_chars(*(data[i:i+8] for i in range(0, n, 8)), off=row)
+            return
+        if op == OP_CLEAR:
+            if client.layers.pop(layer, None) is not None: self.dirty = True
+            return
+        if op not in (OP_WRITE, OP_ERASE) or row >= self.nr or col >= self.nc:
+            raise ValueError('invalid message')
+        if layer not in client.layers:
+            client.layers[layer] = (bytearray(self.nc*self.nr), bytearray(self.nc*self.nr))
+        text, mask = client.layers[layer]
+        start = row*self.nc + col
+        end = start + min(n, self.nc - col)  # clipped to the end of the row
+        if op == OP_WRITE: text[start:end] = data[:end-start]
+        mask[start:end] = (b'\x01' if op == OP_WRITE else b'\x00') * (end-start)
+        self.dirty = True
+
+    def composite(self) -> list[bytearray]:
+        """Composite the layers of all clients into the rows of the LCD."""
+        out = bytearray(b' '*(self.nc*self.nr))
+        layers = sorted((layer, client.order, text, mask)
+                        for client in self.clients for layer, (text, mask) in client.layers.items())
+        for _, _, text, mask in layers:
+            for i in range(len(out)):
+                if mask[i]: out[i] = text[i]
+        return [out[i*self.nc:(i+1)*self.nc] for i in range(self.nr)]
+
+    def flush(self) -> None:
+        """Write the cells of the LCD that changed since the last flush."""
+        for row, (old, new) in enumerate(zip(self.shown, self.composite())):
+            for start, end in _changed_spans(old, new):
+                self.lcd.write_at((row, start), bytes(new[start:end]))
+            self.shown[row] = new
+        self.dirty = False
+
+
+def _changed_spans(old, new, gap: int = 2):
+    """
+    Yields the (start, end) of each run of changed characters. Runs separated by fewer than gap
+    unchanged characters are merged since writing them is cheaper than setting the position again.
+    """
+    start = end = None
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a == b: continue
+        if start is not None and i - end >= gap:
+            yield start, end
+            start = None
+        if start is None: start = i
+        end = i + 1
+    if start is not None: yield start, end
+
+
+class DisplayClient:
+    """
+    Client of the display server. By default everything is drawn in the given layer. This
+    supports enough of the LCD interface to be used in its place for simple drawing (e.g. to run
+    the clock).
+    """
+    def __init__(self, path: str = DEFAULT_SOCKET, layer: int = 0):
+        self.layer = layer
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        dims = b''
+        while len(dims) < 2:
+            data = self.sock.recv(2 - len(dims))
+            if not data: raise ConnectionError('display server closed the connection')
+            dims += data
+        self.nc, self.nr = dims
+
+    def close(self) -> None:
+        """Disconnect from the server, which removes everything drawn by this client."""
+        self.sock.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *args): self.close()
+
+    @property
+    def dims(self): return (self.nc, self.nr)
+
+    def __send(self, op: int, layer: int|None, row: int = 0, col: int = 0, n: int = 0, data: bytes = b'') -> None:
+        """Send a single message to the server."""
+        layer = self.layer if layer is None else layer
+        self.sock.sendall(HEADER.pack(op, layer, row, col, n) + data)
+
+    def write_at(self, pos, s: bytes, layer: int|None = None) -> None:
+        """Write the bytes s at the position (row, col) in the layer."""
+        self.__send(OP_WRITE, layer, pos[0], pos[1], len(s), bytes(s))
+
+    def erase(self, pos, n: int, layer: int|None = None) -> None:
+        """Make n cells at the position (row, col) in the layer transparent."""
+        self.__send(OP_ERASE, layer, pos[0], pos[1], n)
+
+    def clear(self, layer: int|None = None) -> None:
+        """Make the entire layer transparent."""
+        self.__send(OP_CLEAR, layer)
+
+    def write_lines(self, lines, justify: str = 'left', layer: int|None = None) -> None:
+        """
+        Cover the entire LCD with the lines (extra lines are dropped), each justified as specified
+        ('left', 'center', or 'right') and truncated if too long.
+        """
+        if lines and isinstance(lines[0], str): lines = [line.encode('ascii') for line in lines]
+        justify = bytes.center if justify == 'center' else (bytes.rjust if justify == 'right' else bytes.ljust)
+        lines = list(lines[:self.nr]) + [b''] * (self.nr - len(lines))
+        for i, line in enumerate(lines):
+            self.write_at((i, 0), justify(line, self.nc)[:self.nc], layer)
+
+    def set_custom_char(self, i: int, data) -> None:
+        """Set the i-th custom character (shared by all clients)."""
+        self.set_custom_chars(data, off=i)
+
+    def set_custom_chars(self, *data, off: int = 0) -> None:
+        """Set many custom characters starting at character off (shared by all clients)."""
+        data = b''.join(bytes(c) for c in data)
+        self.__send(OP_CHARS, 0, off, 0, len(data), data)
+
+    def scrub(self, n: int = 8) -> int:
+        """Does nothing, the server scrubs the LCD while idle."""
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the display server that shares the LCD')
+    parser.add_argument('--socket', '-s', default=DEFAULT_SOCKET,
+                        help=f'Path of the Unix domain socket (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--rate', '-r', type=float, default=DEFAULT_RATE,
+                        help=f'Messages per second allowed per client (default: {DEFAULT_RATE})')
+    parser.add_argument('--burst', '-b', type=int, default=DEFAULT_BURST,
+                        help=f'Messages allowed per client in a burst (default: {DEFAULT_BURST})')
+    args = parser.parse_args()
+
+    from .lcd_helper import lcd_setup
+    with DisplayServer(lcd_setup(1.0, 0.4), args.socket, args.rate, args.burst) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
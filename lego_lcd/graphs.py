@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Bar graphs and sparklines drawn with the custom characters of the LCD. Values are quantized with
+NumPy into 5x8 cell bitmaps which are packed into custom character data in a single pass. Blank
+and full cells use the built-in characters and the remaining cells are deduplicated so that at
+most 8 distinct custom characters are needed. Custom characters are only uploaded when their
+data changes so the graphs can be updated several times a second.
+"""
+
+import numpy as np
+
+__all__ = ["GraphRenderer", "hbar_cells", "vbar_cells", "sparkline_cells", "pack_cells"]
+
+BLANK = 0x20
+FULL = 0xFF
+CELL_WIDTH = 5
+CELL_HEIGHT = 8
+_COLUMN_BITS = np.array([16, 8, 4, 2, 1], np.uint8)
+_EDGE_CELLS = np.array([[0x00]*CELL_HEIGHT, [0x1F]*CELL_HEIGHT], np.uint8)
+
+
+def _levels(values, n: int, lo: float|None = None, hi: float|None = None) -> np.ndarray:
+    """
+    Quantize values into integer levels from 0 to n inclusive with lo and hi mapping to 0 and n.
+    If not given, lo and hi are the minimum and maximum of the values. NaNs become level 0.
+    """
+    values = np.asarray(values, float)
+    finite = values[np.isfinite(values)]
+    if lo is None: lo = finite.min() if finite.size else 0.0
+    if hi is None: hi = finite.max() if finite.size else 1.0
+    scaled = (values - lo) / ((hi - lo) or 1.0)
+    return np.rint(np.nan_to_num(np.clip(scaled, 0.0, 1.0)) * n).astype(np.intp)
+
+
+def pack_cells(bitmaps: np.ndarray) -> np.ndarray:
+    """
+    Pack boolean cell bitmaps with shape (..., 8, 5) into custom character data with shape
+    (..., 8), each row as a value from 0x00 to 0x1F.
+    """
+    return bitmaps.astype(np.uint8) @ _COLUMN_BITS
+
+
+def hbar_cells(value: float, width: int, lo: float = 0, hi: float = 100) -> np.ndarray:
+    """
+    Packed cells for a horizontal bar that is width characters wide. The bar has a resolution of
+    one pixel column. Returns an array with shape (1, width, 8).
+    """
+    lit = _levels([value], width*CELL_WIDTH, lo, hi)[0]
+    columns = np.arange(width*CELL_WIDTH).reshape(width, 1, CELL_WIDTH) < lit
+    return pack_cells(np.broadcast_to(columns, (width, CELL_HEIGHT, CELL_WIDTH)))[np.newaxis]
+
+
+def vbar_cells(values, rows: int = 1, lo: float = 0, hi: float = 100) -> np.ndarray:
+    """
+    Packed cells for vertical bars, one character wide for each value and rows characters tall.
+    The bars have a resolution of one pixel row. Returns an array with shape (rows, n, 8).
+    """
+    levels = _levels(values, rows*CELL_HEIGHT, lo, hi)
+    height = np.arange(rows*CELL_HEIGHT, 0, -1).reshape(rows, 1, CELL_HEIGHT, 1)  # pixel rows from the top
+    lit = height <= levels.reshape(1, -1, 1, 1)
+    return pack_cells(np.broadcast_to(lit, (rows, len(levels), CELL_HEIGHT, CELL_WIDTH)))
+
+
+def sparkline_cells(series, width: int, rows: int = 1,
+                    lo: float|None = None, hi: float|None = None) -> np.ndarray:
+    """
+    Packed cells for a filled sparkline of the last width*5 values of the series, one pixel column
+    per value. Older values are dropped and missing values are left blank. If not given, lo and hi
+    are the range of the values shown. Returns an array with shape (rows, width, 8).
+    """
+    n = width*CELL_WIDTH
+    series = np.asarray(series, float)[-n:]
+    series = np.concatenate((np.full(n - len(series), np.nan), series))
+    levels = _levels(series, rows*CELL_HEIGHT - 1, lo, hi) + np.isfinite(series)  # always show something
+    height = np.arange(rows*CELL_HEIGHT, 0, -1).reshape(rows, 1, CELL_HEIGHT, 1)
+    lit = height <= levels.reshape(1, width, 1, CELL_WIDTH)
+    return pack_cells(lit)
+
+
+class GraphRenderer:
+    """
+    Draws packed cells on the LCD using a set of the custom characters (all 8 by default). Several
+    graphs can be drawn at different positions and they share the custom characters. Redrawing a
+    graph at the same position reuses its custom characters and only uploads the ones that changed.
+    """
+    def __init__(self, lcd, chars=range(8)):
+        self.lcd = lcd
+        self.chars = tuple(chars)
+        self._loaded = {}  # custom character -> data currently loaded in the LCD
+        self._regions = {}  # position -> (custom characters used, lines written)
+
+    def bar(self, pos, value: float, width: int, lo: float = 0, hi: float = 100) -> None:
+        """Draws a horizontal bar at the position (row, col). See hbar_cells()."""
+        self.draw(pos, hbar_cells(value, width, lo, hi))
+
+    def vbars(self, pos, values, rows: int = 1, lo: float = 0, hi: float = 100) -> None:
+        """Draws vertical bars with the top-left at the position (row, col). See vbar_cells()."""
+        self.draw(pos, vbar_cells(values, rows, lo, hi))
+
+    def sparkline(self, pos, series, width: int, rows: int = 1,
+                  lo: float|None = None, hi: float|None = None) -> None:
+        """Draws a sparkline with the top-left at the position (row, col). See sparkline_cells()."""
+        self.draw(pos, sparkline_cells(series, width, rows, lo, hi))
+
+    def release(self, pos) -> None:
+        """Stop tracking the graph at the position so its custom characters can be used by others."""
+        self._regions.pop(tuple(pos), None)
+
+    def draw(self, pos, cells: np.ndarray) -> None:
+        """
+        Draws packed cells with shape (rows, n, 8) with the top-left at the position (row, col).
+        Each row is written with a single call. If there are more distinct cells than available
+        custom characters, the least common cells are replaced with the most similar ones.
+        """
+        pos = tuple(pos)
+        cells = np.asarray(cells, np.uint8)
+        nrows, ncols = cells.shape[:2]
+        cells = cells.reshape(-1, CELL_HEIGHT)
+
+        # Blank and full cells use built-in characters, everything else is a custom character
+        text = np.full(len(cells), BLANK, np.uint8)
+        text[(cells == 0x1F).all(1)] = FULL
+        custom = np.flatnonzero(cells.any(1) & (text != FULL))
+        uniq, inverse, counts = np.unique(cells[custom], axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        # Determine which custom characters we can use, not the ones used by other graphs
+        taken = set().union(*(used for p, (used, _) in self._regions.items() if p != pos))
+        avail = [c for c in self.chars if c not in taken]
+        if len(uniq) > len(avail):
+            uniq, inverse, codes = self.__reduce(uniq, inverse, counts, len(avail))
+        else:
+            codes = np.zeros(len(uniq), np.uint8)
+
+        # Assign the custom characters, keeping ones that are already loaded
+        needed = [uniq[i].tobytes() for i in range(len(uniq))]
+        missing = []
+        for i, data in enumerate(needed):
+            if codes[i]: continue  # a built-in character replaced it
+            char = next((c for c in avail if self._loaded.get(c) == data), None)
+            if char is None: missing.append(i); continue
+            codes[i] = char
+            avail.remove(char)
+        upload = {}
+        for i, char in zip(missing, avail):
+            codes[i] = char
+            upload[char] = needed[i]
+        self.__upload(upload)
+        if len(custom): text[custom] = codes[inverse]
+
+        # Write each of the rows that changed
+        lines = [text[i*ncols:(i+1)*ncols].tobytes() for i in range(nrows)]
+        _, old = self._regions.get(pos, (None, [None]*nrows))
+        for i, (line, old_line) in enumerate(zip(lines, old)):
+            if line != old_line: self.lcd.write_at((pos[0] + i, pos[1]), line)
+        self._regions[pos] = (frozenset(int(c) for c in codes if c < 8), lines)
+
+    @staticmethod
+    def __reduce(uniq: np.ndarray, inverse: np.ndarray, counts: np.ndarray, n: int):
+        """
+        Reduces the distinct cells to the n most common. The rest are mapped to the most similar
+        of the kept cells or a blank or full cell (by the number of differing pixels). Returns the
+        new distinct cells, the new inverse, and an array of the built-in character for each of
+        the distinct cells (0 for cells that need a custom character).
+        """
+        keep = np.argsort(-counts, kind='stable')[:n]
+        candidates = np.concatenate((uniq[keep], _EDGE_CELLS))
+        diff = np.unpackbits(uniq[:, np.newaxis] ^ candidates[np.newaxis], axis=-1).sum(-1, dtype=np.intp)
+        diff[keep, np.arange(n)] = -1  # kept cells always map to themselves
+        nearest = diff.argmin(1)
+        codes = np.concatenate((np.zeros(n, np.uint8), [BLANK, FULL])).astype(np.uint8)
+        return candidates, nearest[inverse], codes
+
+    def __upload(self, upload: dict) -> None:
+        """Uploads custom character data, each run of consecutive characters at once."""
+        chars = sorted(upload)
+        while chars:
+            n = 1
+            while n < len(chars) and chars[n] == chars[0] + n: n += 1
+            self.lcd.set_custom_chars(*(upload[c] for c in chars[:n]), off=chars[0])
+            self._loaded.update((c, upload[c]) for c in chars[:n])
+            chars = chars[n:]
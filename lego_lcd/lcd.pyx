@@ -1,6 +1,14 @@
 #cython: language_level=3
 
 from cpython.bytes cimport PyBytes_FromStringAndSize
+from threading import RLock
+from libc.string cimport memset
+from libc.math cimport ceil
+from libc.errno cimport errno, ENOTTY
+from posix cimport unistd
+from posix.fcntl cimport open as c_open, O_RDWR
+from posix.ioctl cimport ioctl
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
 from . cimport wiringpi as wp
 
 
@@ -41,6 +49,33 @@ def beep(int pin, double freq=1000, double dur=0.1):
             wp.delayMicroseconds(delay)
         wp.digitalWrite(pin, 0)
     
+cdef inline void delay_ns(unsigned int ns) noexcept nogil:
+    """Busy-waits for at least the given number of nanoseconds (for delays well under 1 ms)"""
+    if ns == 0: return
+    cdef timespec start, now
+    clock_gettime(CLOCK_MONOTONIC, &start)
+    while True:
+        clock_gettime(CLOCK_MONOTONIC, &now)
+        if (now.tv_sec - start.tv_sec) * 1000000000 + (now.tv_nsec - start.tv_nsec) >= ns: return
+
+
+# Bus timings, the defaults work with any HD44780-compatible LCD
+DEFAULT_TIMING = {'en_ns': 1000, 'settle_ns': 1000, 'por_ms': 40, 'init_long_us': 4100, 'init_short_us': 100}
+TIMING_MARGIN = 0.5 # fraction added to calibrated timings
+MIN_TIMING_MARGIN_NS = 100
+
+def with_margin(timing, double margin=TIMING_MARGIN):
+    """
+    Returns a copy of the timing profile with a safety margin added to the calibrated EN pulse and
+    settle times. The margin is a fraction of each time but is always at least 100 ns.
+    """
+    timing = dict(timing)
+    for key in ('en_ns', 'settle_ns'):
+        if key in timing:
+            timing[key] = max(<unsigned int>ceil(timing[key] * (1 + margin)), timing[key] + MIN_TIMING_MARGIN_NS)
+    return timing
+
+
 cdef int[4] LCD_row_offs = [ 0x00, 0x40, 0x14, 0x54 ]
 
 cdef class LCD:
@@ -49,19 +84,38 @@ cdef class LCD:
     cdef int bits
     cdef int nc, nr
     cdef bint inc, shft, on, cur, blnk
+
+    # The expected contents and state of the LCD, based on everything written to it
+    cdef unsigned char[128] ddram
+    cdef unsigned char[64] cgram
+    cdef unsigned long long cg_known # bit mask of the cgram bytes that have been written
+    cdef int ac, entry # address counter and the entry mode bits (I/D and S)
+    cdef bint in_cg
+    cdef int scrub_pos
+
+    # Bus timings, see the timing property
+    cdef unsigned int en_ns, settle_ns, init_long_us, init_short_us
+    cdef int por_ms
+
+    # Held for every use of the bus and for compound operations so the LCD can be used from
+    # several threads, while the GIL is released during the actual bus transfers
+    cdef object lock
+
+    def __cinit__(self, *args, **kwargs):
+        self.lock = RLock()
     
-    def __init__(self, int RS, int RW, int EN, DB, dims):
+    def __init__(self, int RS, int RW, int EN, DB, dims, timing=None, double margin=TIMING_MARGIN):
         """
         Connect to the LCD using the pins RS, RW, EN, and 4 or 8 pins as DB and a width and height
         in dims (e.g. (20,2)). The LCD is started, cleared, and set to no shift, blink, or show the
         cursor. The pin numbers must be given to be compatible with whatever wiringPi setup
-        function was called previously.
+        function was called previously. A timing profile from calibrate_timing() can be given to
+        use faster bus timings, which are used with the given safety margin.
         """
         self.RS = RS; self.RW = RW; self.EN = EN
-        self.inc = True; self.shft = False; self.on = True; self.cur = False; self.blnk = False
-        self.nc, self.nr = dims
-        if (self.nr <= 0 or self.nr > 4 or
-            self.nc <= 0 or self.nc*self.nr > 80): raise ValueError("Invalid dimensions")
+        self.init_dims(dims)
+        self.timing = DEFAULT_TIMING
+        if timing is not None: self.timing = with_margin(timing, margin)
         cdef int bits = len(DB)
         self.bits = bits
         if bits != 4 and bits != 8: raise ValueError("Number of data pins must be 4 or 8")
@@ -69,67 +123,191 @@ cdef class LCD:
         if bits == 8:
             self.DB[4] = DB[4]; self.DB[5] = DB[5]; self.DB[6] = DB[6]; self.DB[7] = DB[7]
 
-        
+        if bits == 4:
+            self._read = self.read4; self._read_data = self.readData4
+            self._write = self.write4; self._write_data = self.writeData4
+        else:
+            self._read = self.read8; self._read_data = self.readData8
+            self._write = self.write8; self._write_data = self.writeData8
+        self._write_data_n = self.writeDataN
+
         # We don't need the GIL from here to the end and there is a lot of waiting
-        # Function Set Command - 001(DL)NF00
-        cdef int por = 40 - wp.millis()
         with nogil:
-            
             # All pins start as outputs and low
             wp.digitalWrite(EN, 0); wp.pinMode(EN, wp.OUTPUT)
             wp.digitalWrite(RS, 0); wp.pinMode(RS, wp.OUTPUT)
             wp.pinMode(RW, wp.OUTPUT)
+            self.init_controller()
+            self.reset_expected()
 
-            if bits == 4:
-                self._read = self.read4; self._read_data = self.readData4
-                self._write = self.write4; self._write_data = self.writeData4
-
-                # Need to wait 40 ms since the LCD received power
-                self.writing4()
-                self.set4(0)
-                if por > 0: wp.delay(por)
-                self.set4(0x3); self.clock(); wp.delayMicroseconds(4100)
-                self.set4(0x3); self.clock(); wp.delayMicroseconds(100)
-                self.set4(0x3); self.clock(); wp.delayMicroseconds(100)
-                self.set4(0x2); self.clock()
-
-                # Set default state to reading and send "Function Set Command"
-                self.reading4()
-                self.write4(0x20 | (0x08 if self.nr != 1 else 0))
-
-                # Setup display
-                self.write4(0x08) # Display off
-                self.write4(0x01) # Clear display
-                self.write4(0x06) # Set entry mode: increment and no shift
-                self.write4(0x80) # Set DDRAM address to 0
-                self.write4(0x0C) # Display on
+    cdef void init_controller(self) noexcept nogil:
+        """
+        Initializes the LCD controller by instruction, which works regardless of the state it was
+        in, and then clears the display with the default display state.
+        """
+        # Function Set Command - 001(DL)NF00
+        cdef int por = self.por_ms - wp.millis()
+        if self.bits == 4:
+            # Need to wait 40 ms since the LCD received power
+            self.writing4()
+            self.set4(0)
+            if por > 0: wp.delay(por)
+            self.set4(0x3); self.clock(); wp.delayMicroseconds(self.init_long_us)
+            self.set4(0x3); self.clock(); wp.delayMicroseconds(self.init_short_us)
+            self.set4(0x3); self.clock(); wp.delayMicroseconds(self.init_short_us)
+            self.set4(0x2); self.clock()
 
-            else:
-                self._read = self.read8; self._read_data = self.readData8
-                self._write = self.write8; self._write_data = self.writeData8
-
-                # Need to wait 40 ms since the LCD recieved power
-                self.writing8()
-                self.set8(0)
-                if por > 0: wp.delay(por)
-                self.set8(0x30); self.clock(); wp.delayMicroseconds(4100)
-                self.set8(0x30); self.clock(); wp.delayMicroseconds(100)
-                self.set8(0x30); self.clock()
-
-                # Set default state to reading and send "Function Set Command"
-                self.reading8()
-                self.write8(0x30 | (0x08 if self.nr != 1 else 0))
-
-                # Setup display
-                self.write8(0x08) # Display off
-                self.write8(0x01) # Clear display
-                self.write8(0x06) # Set entry mode: increment and no shift
-                self.write8(0x80) # Set DDRAM address to 0
-                self.write8(0x0C) # Display on
+            # Set default state to reading and send "Function Set Command"
+            self.reading4()
+            self.write4(0x20 | (0x08 if self.nr != 1 else 0))
+
+            # Setup display
+            self.write4(0x08) # Display off
+            self.write4(0x01) # Clear display
+            self.write4(0x06) # Set entry mode: increment and no shift
+            self.write4(0x80) # Set DDRAM address to 0
+            self.write4(0x0C) # Display on
+
+        else:
+            # Need to wait 40 ms since the LCD recieved power
+            self.writing8()
+            self.set8(0)
+            if por > 0: wp.delay(por)
+            self.set8(0x30); self.clock(); wp.delayMicroseconds(self.init_long_us)
+            self.set8(0x30); self.clock(); wp.delayMicroseconds(self.init_short_us)
+            self.set8(0x30); self.clock()
+
+            # Set default state to reading and send "Function Set Command"
+            self.reading8()
+            self.write8(0x30 | (0x08 if self.nr != 1 else 0))
+
+            # Setup display
+            self.write8(0x08) # Display off
+            self.write8(0x01) # Clear display
+            self.write8(0x06) # Set entry mode: increment and no shift
+            self.write8(0x80) # Set DDRAM address to 0
+            self.write8(0x0C) # Display on
+
+    cdef void reset_expected(self) noexcept nogil:
+        """Sets the expected contents to that right after initialization"""
+        memset(self.ddram, 0x20, 128)
+        self.cg_known = 0
+        self.ac = 0; self.entry = 0x2; self.in_cg = False
+        self.scrub_pos = 0
+
+    cdef init_dims(self, dims):
+        """Sets the default display state and the dimensions, checking that they are valid"""
+        self.inc = True; self.shft = False; self.on = True; self.cur = False; self.blnk = False
+        self.nc, self.nr = dims
+        if (self.nr <= 0 or self.nr > 4 or
+            self.nc <= 0 or self.nc*self.nr > 80): raise ValueError("Invalid dimensions")
 
     @property
     def dims(self): return (self.nc, self.nr)
 
+    @property
+    def timing(self):
+        """
+        Gets/sets the bus timings as a dict with en_ns (the EN pulse width), settle_ns (the time
+        before raising EN to read), por_ms (the time since power on before initializing), and
+        init_long_us and init_short_us (the waits during initialization). Setting only changes the
+        timings given. Only the GPIO interface uses these timings.
+        """
+        return {'en_ns': self.en_ns, 'settle_ns': self.settle_ns, 'por_ms': self.por_ms,
+                'init_long_us': self.init_long_us, 'init_short_us': self.init_short_us}
+    @timing.setter
+    def timing(self, timing):
+        if not set(timing) <= set(DEFAULT_TIMING): raise KeyError('Unknown timings')
+        with self.lock:
+            self.en_ns = timing.get('en_ns', self.en_ns)
+            self.settle_ns = timing.get('settle_ns', self.settle_ns)
+            self.por_ms = timing.get('por_ms', self.por_ms)
+            self.init_long_us = timing.get('init_long_us', self.init_long_us)
+            self.init_short_us = timing.get('init_short_us', self.init_short_us)
+
+    ##### TIMING CALIBRATION #####
+    cdef bint verify_(self, int trials, unsigned int seed) noexcept nogil:
+        """
+        Writes pseudo-random test patterns to all of the custom characters and the first row of the
+        display data and reads them back. Returns True if all of the trials read back correctly.
+        The entry mode must be incrementing. The expected contents are not changed.
+        """
+        cdef unsigned char out[80]
+        cdef unsigned char buf[80]
+        cdef int t, i
+        for t in range(trials):
+            for i in range(64):
+                seed = seed * 1103515245 + 12345; out[i] = (seed >> 16) & 0x1F
+            self.command(0x40)
+            self._write_data_n(self, out, 64)
+            self.command(0x40)
+            if self._read(self) & 0x7F != 0: return False
+            for i in range(64):
+                if (self._read_data(self) ^ out[i]) & 0x1F: return False
+            for i in range(self.nc):
+                seed = seed * 1103515245 + 12345; out[i] = 0x20 + (seed >> 16) % 0x5F
+            self.command(0x80)
+            self._write_data_n(self, out, self.nc)
+            self.command(0x80)
+            if self._read(self) & 0x7F != 0: return False
+            for i in range(self.nc): buf[i] = self._read_data(self)
+            for i in range(self.nc):
+                if buf[i] != out[i]: return False
+        return True
+
+    cdef unsigned int search_(self, unsigned int* value, int trials, unsigned int step) noexcept nogil:
+        """
+        Binary searches for the smallest multiple of step for the timing pointed to by value that the
+        LCD passes the verification with. The current value must already pass the verification. The
+        LCD is reinitialized after each failure since it may no longer be in sync. The value is left
+        at the result.
+        """
+        cdef unsigned int lo = 0, hi = value[0], mid
+        while lo < hi:
+            mid = lo + (hi - lo) // 2 // step * step
+            value[0] = mid
+            if self.verify_(trials, mid): hi = mid
+            else:
+                value[0] = hi
+                self.init_controller()
+                self.command(0x06)
+                lo = min(mid + step, hi)
+        value[0] = hi
+        return hi
+
+    def calibrate_timing(self, int trials=20, unsigned int step=50):
+        """
+        Searches for the shortest EN pulse and settle times (in multiples of step ns and starting
+        from the default timings) that the LCD reliably works with by writing test patterns and
+        reading them back trials times each. The timings are then set to the result with the
+        default safety margin and the contents of the LCD are restored. Returns the timing profile
+        found (without the margin), which can be saved and given to the constructor later. If the
+        LCD does not read back correctly even with the default timings (e.g. RW is tied to ground)
+        a RuntimeError is raised and the timings are not changed.
+        """
+        if step == 0: raise ValueError('step must be positive')
+        cdef int ac, entry
+        cdef bint in_cg, ok
+        cdef unsigned int en_ns = DEFAULT_TIMING['en_ns'], settle_ns = DEFAULT_TIMING['settle_ns']
+        with self.lock:
+            ac = self.ac; entry = self.entry; in_cg = self.in_cg
+            original = self.timing
+            with nogil:
+                self.en_ns = en_ns; self.settle_ns = settle_ns
+                self.command(0x06)
+                ok = self.verify_(trials, 1)
+                if ok:
+                    self.search_(&self.en_ns, trials, step)
+                    self.search_(&self.settle_ns, trials, step)
+            profile = self.timing
+            self.timing = with_margin(profile) if ok else original
+            with nogil:
+                self.init_controller()
+                self.ac = ac; self.entry = entry; self.in_cg = in_cg
+                self.restore()
+        if not ok: raise RuntimeError('The LCD does not read back correctly so the timings cannot be calibrated')
+        return profile
+
     ########## CORE INTERFACE ##########
     # These are written different for the 4 and 8 bit interfaces and are properly mapped
     # in the __init__ function.
@@ -137,10 +315,11 @@ cdef class LCD:
     cdef int (*_read_data)(LCD) noexcept nogil
     cdef void (*_write)(LCD, unsigned char x) noexcept nogil
     cdef void (*_write_data)(LCD, unsigned char x) noexcept nogil
+    cdef void (*_write_data_n)(LCD, const unsigned char* s, Py_ssize_t n) noexcept nogil
 
     cdef inline void clock(self) noexcept nogil:
         """Clocks a command in (EN pin high then low)"""
-        wp.digitalWrite(self.EN, 1); wp.delayMicroseconds(1); wp.digitalWrite(self.EN, 0)
+        wp.digitalWrite(self.EN, 1); delay_ns(self.en_ns); wp.digitalWrite(self.EN, 0)
     cdef inline void set8(self, unsigned char x) noexcept nogil:
         """Sets 8 bits to the DB pins"""
         wp.digitalWrite(self.DB[7], x&0x80)
@@ -189,7 +368,7 @@ cdef class LCD:
         """Checks if the LCD is busy or not (8-bit interface)"""
         # RS, RW = 0, 1
         wp.digitalWrite(self.EN, 1)
-        wp.delayMicroseconds(1)
+        delay_ns(self.en_ns)
         cdef bint busy = wp.digitalRead(self.DB[7])
         wp.digitalWrite(self.EN, 0)
         return busy
@@ -197,38 +376,43 @@ cdef class LCD:
         """Checks if the LCD is busy or not (4-bit interface)"""
         # RS, RW = 0, 1
         wp.digitalWrite(self.EN, 1)
-        wp.delayMicroseconds(1)
+        delay_ns(self.en_ns)
         cdef bint busy = wp.digitalRead(self.DB[3])
         wp.digitalWrite(self.EN, 0)
         wp.digitalWrite(self.EN, 1)
         wp.digitalWrite(self.EN, 0)
         return busy
     @property
-    def busy(self): return self.busy8() if self.bits == 8 else self.busy4()
+    def busy(self):
+        cdef bint busy
+        with self.lock, nogil: busy = self.busy8() if self.bits == 8 else self.busy4()
+        return busy
     
     cdef inline void wait8(self) noexcept nogil:
         """Waits for the LCD to not be busy (8-bit interface)"""
         # RS, RW = 0, 1
         cdef int EN = self.EN, DB = self.DB[7]
+        cdef unsigned int en = self.en_ns, settle = self.settle_ns
         cdef bint busy = True
         while busy:
-            wp.delayMicroseconds(1); wp.digitalWrite(EN, 1)
-            wp.delayMicroseconds(1); busy = wp.digitalRead(DB); wp.digitalWrite(EN, 0)
+            delay_ns(settle); wp.digitalWrite(EN, 1)
+            delay_ns(en); busy = wp.digitalRead(DB); wp.digitalWrite(EN, 0)
     cdef inline void wait4(self) noexcept nogil:
         """Waits for the LCD to not be busy (4-bit interface)"""
         # RS, RW = 0, 1
         cdef int EN = self.EN, DB = self.DB[3]
+        cdef unsigned int en = self.en_ns, settle = self.settle_ns
         cdef bint busy = True
         while busy:
-            wp.delayMicroseconds(1); wp.digitalWrite(EN, 1)
-            wp.delayMicroseconds(1); busy = wp.digitalRead(DB); wp.digitalWrite(EN, 0)
-            wp.delayMicroseconds(1); wp.digitalWrite(EN, 1)
-            wp.delayMicroseconds(1); wp.digitalWrite(EN, 0)
+            delay_ns(settle); wp.digitalWrite(EN, 1)
+            delay_ns(en); busy = wp.digitalRead(DB); wp.digitalWrite(EN, 0)
+            delay_ns(settle); wp.digitalWrite(EN, 1)
+            delay_ns(en); wp.digitalWrite(EN, 0)
 
     cdef inline int __read8(self) noexcept nogil:
         """Read a single byte from the LCD, which must not be busy and RS set properly (8-bit interface)"""
         # RW = 1
-        wp.delayMicroseconds(1); wp.digitalWrite(self.EN, 1); wp.delayMicroseconds(1)
+        delay_ns(self.settle_ns); wp.digitalWrite(self.EN, 1); delay_ns(self.en_ns)
         cdef int out = (
             wp.digitalRead(self.DB[7]) << 7 | wp.digitalRead(self.DB[6]) << 6 |
             wp.digitalRead(self.DB[5]) << 5 | wp.digitalRead(self.DB[4]) << 4 |
@@ -239,12 +423,12 @@ cdef class LCD:
     cdef inline int __read4(self) noexcept nogil:
         """Read a single byte from the LCD, which must not be busy and RS set properly (4-bit interface)"""
         # RW = 1
-        wp.delayMicroseconds(1); wp.digitalWrite(self.EN, 1); wp.delayMicroseconds(1)
+        delay_ns(self.settle_ns); wp.digitalWrite(self.EN, 1); delay_ns(self.en_ns)
         cdef int out = (
             wp.digitalRead(self.DB[3]) << 7 | wp.digitalRead(self.DB[2]) << 6 |
             wp.digitalRead(self.DB[1]) << 5 | wp.digitalRead(self.DB[0]) << 4)
         wp.digitalWrite(self.EN, 0)
-        wp.delayMicroseconds(1); wp.digitalWrite(self.EN, 1); wp.delayMicroseconds(1)
+        delay_ns(self.settle_ns); wp.digitalWrite(self.EN, 1); delay_ns(self.en_ns)
         out |= (wp.digitalRead(self.DB[3]) << 3 | wp.digitalRead(self.DB[2]) << 2 |
                 wp.digitalRead(self.DB[1]) << 1 | wp.digitalRead(self.DB[0]) << 0)
         wp.digitalWrite(self.EN, 0)
@@ -318,17 +502,138 @@ cdef class LCD:
         self.__write4(x)
         wp.digitalWrite(self.RS, 0)
 
+    cdef void writeDataN(self, const unsigned char* s, Py_ssize_t n) noexcept nogil:
+        """Writes several bytes to the LCD as data, one at a time"""
+        cdef Py_ssize_t i
+        for i in range(n): self._write_data(self, s[i])
+
+    ########## EXPECTED CONTENTS ##########
+    cdef void advance(self, bint inc) noexcept nogil:
+        """Moves the expected address counter the same way the LCD does after data is read or written"""
+        if self.in_cg: self.ac = (self.ac + (1 if inc else -1)) & 0x3F
+        elif self.nr == 1: self.ac = (self.ac + (1 if inc else 79)) % 80
+        elif inc: self.ac = 0x40 if self.ac == 0x27 else (0x00 if self.ac == 0x67 else self.ac + 1)
+        else: self.ac = 0x67 if self.ac == 0x00 else (0x27 if self.ac == 0x40 else self.ac - 1)
+
+    cdef void command(self, unsigned char x) noexcept nogil:
+        """Writes a command to the LCD, keeping track of the expected address counter and contents"""
+        self._write(self, x)
+        if x & 0x80: self.ac = x & 0x7F; self.in_cg = False # Set DDRAM address
+        elif x & 0x40: self.ac = x & 0x3F; self.in_cg = True # Set CGRAM address
+        elif x & 0x20: pass # Function set
+        elif x & 0x10: # Cursor or display shift
+            if not x & 0x08: self.advance(x & 0x04)
+        elif x & 0x08: pass # Display mode
+        elif x & 0x04: self.entry = x & 0x3 # Entry mode
+        elif x & 0x03: # Clear display or return home
+            if x == 0x01: memset(self.ddram, 0x20, 128); self.entry |= 0x2
+            self.ac = 0; self.in_cg = False
+
+    cdef void restore(self) noexcept nogil:
+        """Writes all of the expected contents and state to the LCD"""
+        cdef int ac = self.ac, entry = self.entry
+        cdef bint in_cg = self.in_cg
+        self.command(0x06)
+        if self.cg_known:
+            self.command(0x40)
+            self._write_data_n(self, self.cgram, 64)
+        if self.nr == 1:
+            self.command(0x80)
+            self._write_data_n(self, self.ddram, 80)
+        else:
+            self.command(0x80)
+            self._write_data_n(self, self.ddram, 40)
+            self.command(0xC0)
+            self._write_data_n(self, &self.ddram[0x40], 40)
+        self.command(0x04 | entry)
+        self.command(0x08 | (self.on << 2) | (self.cur << 1) | self.blnk)
+        self.command((0x40 if in_cg else 0x80) | ac)
+
+    cdef void reinitialize_(self) noexcept nogil:
+        """Initializes the LCD controller again and restores its expected contents and state"""
+        cdef int ac = self.ac, entry = self.entry
+        cdef bint in_cg = self.in_cg
+        self.init_controller()
+        self.ac = ac; self.entry = entry; self.in_cg = in_cg
+        self.restore()
+
+    cdef int scrub_(self, int n) noexcept nogil:
+        """
+        Checks the next window of at most n bytes of the visible display data and the known custom
+        character data against the expected contents, rewriting the bytes that differ. The LCD is
+        reinitialized if it does not have the address that was just set. Returns the number of
+        bytes that differed or -1 if the LCD was reinitialized.
+        """
+        cdef unsigned char buf[80]
+        cdef unsigned char* expected
+        cdef unsigned char mask
+        cdef unsigned long long known = ~0ULL
+        cdef int size = self.nr * self.nc, pos = self.scrub_pos, addr, cmd, i, first = -1, last = -1, count = 0
+        cdef int ac = self.ac, entry = self.entry
+        cdef bint in_cg = self.in_cg
+        if n > 80: n = 80
+        if n <= 0: return 0
+        if pos < size:
+            # Part of a row of the display data
+            addr = LCD_row_offs[pos // self.nc] + pos % self.nc
+            if n > self.nc - pos % self.nc: n = self.nc - pos % self.nc
+            cmd = 0x80 | addr; expected = &self.ddram[addr]; mask = 0xFF
+        else:
+            # Part of the custom character data, but only the bytes that have been written
+            addr = pos - size
+            if n > 64 - addr: n = 64 - addr
+            cmd = 0x40 | addr; expected = &self.cgram[addr]; mask = 0x1F
+            known = self.cg_known >> addr
+        self.scrub_pos = (pos + n) % (size + 64)
+        if not known & (~0ULL if n >= 64 else (1ULL << n) - 1): return 0
+
+        if entry != 0x2: self.command(0x06)
+        self.command(cmd)
+        if self._read(self) & 0x7F != addr:
+            self.reinitialize_()
+            return -1
+        self.read_raw(buf, n)
+        for i in range(n):
+            if (buf[i] ^ expected[i]) & mask and (i >= 64 or (known >> i) & 1):
+                if first < 0: first = i
+                last = i
+                count += 1
+        if count:
+            self.command(cmd + first)
+            self._write_data_n(self, expected + first, last - first + 1)
+        if entry != 0x2: self.command(0x04 | entry)
+        self.command((0x40 if in_cg else 0x80) | ac)
+        return count
+
+    def scrub(self, int n=8):
+        """
+        Reads back a window of n bytes from the LCD and compares them to what was written, rewriting
+        any that differ. Each call checks the next window so calling this regularly (e.g. while
+        idle) eventually checks the entire display and the custom characters and repairs any
+        corruption. At most n bytes (up to 80) plus a few commands are transferred unless the LCD
+        needs to be reinitialized, which happens if it does not respond as expected (e.g. after
+        a brown-out). Returns the number of bytes that were wrong or -1 if it was reinitialized.
+        """
+        cdef int count
+        with self.lock, nogil: count = self.scrub_(n)
+        return count
+
+    def reinitialize(self):
+        """Initializes the LCD again and writes everything that was written to it."""
+        with self.lock, nogil: self.reinitialize_()
+
     ########## COMMANDS ##########
     def clear(self):
         """
         Sets all display data to spaces, sets the display address to 0, resets the shift to the
         initial position, and sets the increment to True.
         """
-        self._write(self, 0x01)
-        self.inc = True
+        with self.lock:
+            with nogil: self.command(0x01)
+            self.inc = True
     def return_home(self):
         """Sets the display address to 0 and resets the shift to the initial position."""
-        self._write(self, 0x02)
+        with self.lock, nogil: self.command(0x02)
     
     # Entry mode - 000001(I/D)S
     @property
@@ -336,17 +641,19 @@ cdef class LCD:
     @increment.setter
     def increment(self, bint value):
         value = 1 if value else 0
-        if self.inc != value:
-            self._write(self, 0x04 | (value << 1) | self.shft)
-            self.inc = value
+        with self.lock:
+            if self.inc != value:
+                with nogil: self.command(0x04 | (value << 1) | self.shft)
+                self.inc = value
     @property
     def shift(self): return self.shift
     @shift.setter
     def shift(self, bint value):
         value = 1 if value else 0
-        if self.shft != value:
-            self._write(self, 0x04 | (self.inc << 1) | value)
-            self.shft = value
+        with self.lock:
+            if self.shft != value:
+                with nogil: self.command(0x04 | (self.inc << 1) | value)
+                self.shft = value
 
     # Display Mode - 00001DCB
     @property
@@ -354,49 +661,52 @@ cdef class LCD:
     @on.setter
     def on(self, bint value):
         value = 1 if value else 0
-        if self.on != value:
-            self._write(self, 0x08 | (value << 2) | (self.cur << 1) | self.blnk)
-            self.on = value
+        with self.lock:
+            if self.on != value:
+                with nogil: self.command(0x08 | (value << 2) | (self.cur << 1) | self.blnk)
+                self.on = value
     @property
     def cursor(self): return self.cur
     @cursor.setter
     def cursor(self, bint value):
         value = 1 if value else 0
-        if self.cur != value:
-            self._write(self, 0x08 | (self.on << 2) | (value << 1) | self.blnk)
-            self.cur = value
+        with self.lock:
+            if self.cur != value:
+                with nogil: self.command(0x08 | (self.on << 2) | (value << 1) | self.blnk)
+                self.cur = value
     @property
     def blink(self): return self.blnk
     @blink.setter
     def blink(self, bint value):
         value = 1 if value else 0
-        if self.blnk != value:
-            self._write(self, 0x08 | (self.on << 2) | (self.cur << 1) | value)
-            self.blnk = value
+        with self.lock:
+            if self.blnk != value:
+                with nogil: self.command(0x08 | (self.on << 2) | (self.cur << 1) | value)
+                self.blnk = value
     
     # Cursor or Display Shift - 0001(S/C)(R/L)xx
     def left(self):
         """Moves the cursor to the left as if a character was written to the display."""
-        self._write(self, 0x10)
+        with self.lock, nogil: self.command(0x10)
     def right(self):
         """Moves the cursor to the right."""
-        self._write(self, 0x14)
+        with self.lock, nogil: self.command(0x14)
     def shift_left(self):
         """Shifts the entire display to the left along with shifting the cursor."""
-        self._write(self, 0x18)
+        with self.lock, nogil: self.command(0x18)
     def shift_right(self):
         """Shifts the entire display to the right along with shifting the cursor."""
-        self._write(self, 0x1C)
+        with self.lock, nogil: self.command(0x1C)
     
     # Get/Set the DDRAM/CGRAM Address
     cdef void set_cgram_addr(self, int x) noexcept nogil:
         """Sets the raw CGRAM address"""
         #assert(0 <= x < 0x40)
-        self._write(self, 0x40 | x)
+        self.command(0x40 | x)
     cdef void set_ddram_addr(self, int x) noexcept nogil:
         """Sets the raw DDRAM address"""
         #assert(0 <= x < 0x80)
-        self._write(self, 0x80 | x)
+        self.command(0x80 | x)
     cdef int get_addr(self) noexcept nogil:
         """
         Gets the current raw address, unknown if it is CGRAM or DDRAM though. However we keep this
@@ -406,7 +716,8 @@ cdef class LCD:
     @property
     def position(self):
         """Gets/sets the current position on the screen in row,col coordinates."""
-        cdef int ac = self.get_addr()
+        cdef int ac
+        with self.lock, nogil: ac = self.get_addr()
         if self.nr == 1: return (ac, 0)
         if self.nr == 2: return (ac & 0x3F, 0 if ac < 0x40 else 1)
         if ac < 0x14: return (ac, 0)
@@ -417,7 +728,7 @@ cdef class LCD:
         cdef int r,c
         r,c = value
         if r < 0 or r >= self.nr or c < 0 or c >= self.nc: raise ValueError('Invalid position')
-        self.set_ddram_addr(c + LCD_row_offs[r])
+        with self.lock, nogil: self.set_ddram_addr(c + LCD_row_offs[r])
         
     ##### SAVE / RESTORE STATE #####
     @property
@@ -427,45 +738,63 @@ cdef class LCD:
         settings the state is an expensive operation. The state object returned should not be
         modified.
         """
-        entry = (self.inc << 1) | self.shft
-        display = (self.on << 2) | (self.cur << 1) | self.blnk
-        chars = self.get_custom_chars()
-        ddram_addr = self.get_addr()
-        self.set_ddram_addr(0)
-        self._write(self, 0x06)
-        text = self.read(80)
-        self.set_ddram_addr(ddram_addr)
-        self._write(self, 0x04 | entry)
+        cdef int entry, display, ddram_addr
+        with self.lock:
+            entry = (self.inc << 1) | self.shft
+            display = (self.on << 2) | (self.cur << 1) | self.blnk
+            chars = self.get_custom_chars()
+            with nogil:
+                ddram_addr = self.get_addr()
+                self.set_ddram_addr(0)
+                self.command(0x06)
+            text = self.read(80)
+            with nogil:
+                self.set_ddram_addr(ddram_addr)
+                self.command(0x04 | entry)
         return entry, display, chars, ddram_addr, text
     @state.setter
     def state(self, state):
+        cdef int entry, display, ddram_addr
         entry, display, chars, ddram_addr, text = state
-        self._write(self, 0x06)
-        self.set_custom_chars(*chars)
-        self.set_ddram_addr(0)
-        self.write(text)
-        self.set_ddram_addr(ddram_addr)
-        self._write(self, 0x04 | (entry & 0x3))
-        self._write(self, 0x08 | (display & 0x7))
+        with self.lock:
+            with nogil: self.command(0x06)
+            self.set_custom_chars(*chars)
+            with nogil: self.set_ddram_addr(0)
+            self.write(text)
+            with nogil:
+                self.set_ddram_addr(ddram_addr)
+                self.command(0x04 | (entry & 0x3))
+                self.command(0x08 | (display & 0x7))
     
     ##### WRITING / READING #####
-    cdef inline void write_raw(self, unsigned char* s, Py_ssize_t n) nogil:
+    cdef inline void write_raw(self, unsigned char* s, Py_ssize_t n) noexcept nogil:
+        self._write_data_n(self, s, n)
         cdef Py_ssize_t i
-        for i in range(n): self._write_data(self, s[i])
+        for i in range(n):
+            if self.in_cg: self.cgram[self.ac] = s[i]; self.cg_known |= 1ULL << self.ac
+            else: self.ddram[self.ac] = s[i]
+            self.advance(self.entry & 0x2)
     def write(self, bytes s):
         """
         Writes the string s to the LCD screen at the current cursor position. s must be a bytes or
         bytearray object. The cursor will be advanced by the length of the string (or reversed if
         increment is False). The screen will possibly be shifted if shift is True.
         """
-        self.write_raw(<unsigned char*><char*>s, len(s))
+        cdef unsigned char* p = <unsigned char*><char*>s
+        cdef Py_ssize_t n = len(s)
+        with self.lock, nogil: self.write_raw(p, n)
     def write_at(self, pos, bytes s):
         """Equivilent to `lcd.position = pos; lcd.write(s)`"""
-        self.position = pos
-        self.write_raw(<unsigned char*><char*>s, len(s))
-    cdef inline void read_raw(self, unsigned char* s, Py_ssize_t n) nogil:
+        cdef unsigned char* p = <unsigned char*><char*>s
+        cdef Py_ssize_t n = len(s)
+        with self.lock:
+            self.position = pos
+            with nogil: self.write_raw(p, n)
+    cdef inline void read_raw(self, unsigned char* s, Py_ssize_t n) noexcept nogil:
         cdef Py_ssize_t i
-        for i in range(n): s[i] = self._read_data(self)
+        for i in range(n):
+            s[i] = self._read_data(self)
+            self.advance(self.entry & 0x2)
     def read(self, int n=1):
         """
         Reads n values from the LCD screen at the current cursor position. The cursor will be
@@ -473,25 +802,30 @@ cdef class LCD:
         possibly be shifted if shift is True.
         """
         cdef bytes s = PyBytes_FromStringAndSize(NULL, n)
-        self.read_raw(<unsigned char*><char*>s, n)
+        cdef unsigned char* p = <unsigned char*><char*>s
+        with self.lock, nogil: self.read_raw(p, n)
         return s
     def read_from(self, pos, int n=1):
         """Equivilent to `lcd.position = pos; lcd.read(n)`"""
-        self.position = pos
         cdef bytes s = PyBytes_FromStringAndSize(NULL, n)
-        self.read_raw(<unsigned char*><char*>s, n)
+        cdef unsigned char* p = <unsigned char*><char*>s
+        with self.lock:
+            self.position = pos
+            with nogil: self.read_raw(p, n)
         return s
         
     ##### ADVANCED WRITING / READING #####
     def read_all(self):
         """Reads all lines from the LCD into a list using read_from."""
-        return [self.read_from((i, 0), self.nc) for i in range(self.nr)]
+        with self.lock:
+            return [self.read_from((i, 0), self.nc) for i in range(self.nr)]
 
     def write_all(self, *lines):
         """Writes many lines to the LCD using write_at after clearing the screen."""
-        self.clear()
-        for i, line in zip(range(self.nr), lines): # don't use enumerate as we want to stop when either of them is finished
-            self.write_at((i, 0), line)
+        with self.lock:
+            self.clear()
+            for i, line in zip(range(self.nr), lines): # don't use enumerate as we want to stop when either of them is finished
+                self.write_at((i, 0), line)
 
     def write_lines(self, lines, justify='left', bytes ellipsis=b'_'):
         """
@@ -528,15 +862,18 @@ cdef class LCD:
         is 'standard'. This remembers the data address and restores the shift and incrementing
         back.
         """
-        cdef int ac = self.get_addr()
-        self.set_cgram_addr(i*8)
-        if self.inc and not self.shft:
-            x = f()
-        else:
-            self._write(self, 0x06)
-            x = f()
-            self._write(self, 0x04 | (self.inc << 1) | self.shft)
-        self.set_ddram_addr(ac)
+        cdef int ac
+        with self.lock:
+            with nogil:
+                ac = self.get_addr()
+                self.set_cgram_addr(i*8)
+            if self.inc and not self.shft:
+                x = f()
+            else:
+                with nogil: self.command(0x06)
+                x = f()
+                with nogil: self.command(0x04 | (self.inc << 1) | self.shft)
+            with nogil: self.set_ddram_addr(ac)
         return x
 
     def set_custom_char(self, int i, data):
@@ -580,3 +917,198 @@ cdef class LCD:
         if n <= 0: return []
         data = self.__execute_char(start, lambda:self.read(8*n))
         return [data[i:i+8] for i in range(0, 8*n, 8)]
+
+
+# I2C Backpack Interface
+# Most I2C backpacks use a PCF8574 I/O expander with the pins P0-P7 wired as RS, RW, EN, the
+# backlight, and DB4-DB7 in 4-bit mode. Every change of the pins is a byte sent over the bus so
+# whole strings are encoded into a single buffer and sent with a single write.
+cdef enum:
+    I2C_RS = 0x01
+    I2C_RW = 0x02
+    I2C_EN = 0x04
+    I2C_BL = 0x08
+    I2C_SLAVE = 0x0703 # from linux/i2c-dev.h
+    I2C_BUF_SIZE = 512
+
+cdef class I2CLCD(LCD):
+    cdef int fd
+    cdef unsigned char bl, port
+
+    def __init__(self, int bus=1, int addr=0x27, dims=(16, 2), path=None):
+        """
+        Connect to the LCD through a PCF8574-based I2C backpack at the given address on the given
+        I2C bus (e.g. 1 for /dev/i2c-1) and with a width and height in dims. The LCD is started,
+        cleared, and set to no shift, blink, or show the cursor. Instead of a bus number, the path
+        to a device can be given. For testing without hardware this can be a regular file which
+        will receive the raw bytes sent to the backpack (reads always report not busy and 0x00).
+        No wiringPi setup function needs to be called for this interface.
+        """
+        self.fd = -1
+        self.init_dims(dims)
+        self.timing = DEFAULT_TIMING
+        self.bits = 4
+        self.bl = I2C_BL
+        # The core interface is typed for LCD so the methods need to be cast
+        self._read = <int (*)(LCD) noexcept nogil>self.readI2C
+        self._read_data = <int (*)(LCD) noexcept nogil>self.readDataI2C
+        self._write = <void (*)(LCD, unsigned char) noexcept nogil>self.writeI2C
+        self._write_data = <void (*)(LCD, unsigned char) noexcept nogil>self.writeDataI2C
+        self._write_data_n = <void (*)(LCD, const unsigned char*, Py_ssize_t) noexcept nogil>self.writeDataNI2C
+
+        if path is None: path = '/dev/i2c-%d' % bus
+        cdef bytes path_b = path.encode() if isinstance(path, unicode) else path
+        self.fd = c_open(path_b, O_RDWR)
+        if self.fd < 0: raise OSError(errno, "Could not open I2C device", path)
+        if ioctl(self.fd, I2C_SLAVE, addr) < 0 and errno != ENOTTY: # ENOTTY for a stand-in file
+            raise OSError(errno, "Could not select I2C address 0x%02X" % addr, path)
+
+        # The PCF8574 powers up with all pins high, bring them all low
+        self.port = 0xFF
+        cdef unsigned char zero = self.bl
+        if unistd.write(self.fd, &zero, 1) != 1: raise OSError(errno, "Could not write to I2C device", path)
+        self.port = zero
+
+        with nogil:
+            self.init_controller()
+            self.reset_expected()
+
+    def calibrate_timing(self, int trials=20, unsigned int step=50):
+        """The I2C interface does not use the bus timings so they cannot be calibrated."""
+        raise NotImplementedError('The I2C interface does not use the bus timings')
+
+    cdef void init_controller(self) noexcept nogil:
+        """Initializes the LCD controller by instruction with the default display state"""
+        # Need to wait 40 ms since the LCD received power
+        unistd.usleep(40000)
+        self.nibbleI2C(0x3); unistd.usleep(4100)
+        self.nibbleI2C(0x3); unistd.usleep(100)
+        self.nibbleI2C(0x3); unistd.usleep(100)
+        self.nibbleI2C(0x2)
+
+        # Send "Function Set Command"
+        self.writeI2C(0x20 | (0x08 if self.nr != 1 else 0))
+
+        # Setup display
+        self.writeI2C(0x08) # Display off
+        self.writeI2C(0x01) # Clear display
+        self.writeI2C(0x06) # Set entry mode: increment and no shift
+        self.writeI2C(0x80) # Set DDRAM address to 0
+        self.writeI2C(0x0C) # Display on
+
+    def __dealloc__(self):
+        if self.fd >= 0: unistd.close(self.fd)
+
+    @property
+    def backlight(self):
+        """Gets/sets if the backlight is on. Unlike the GPIO interface, the backpack controls it."""
+        return self.bl != 0
+    @backlight.setter
+    def backlight(self, bint value):
+        cdef unsigned char b
+        with self.lock, nogil:
+            self.bl = I2C_BL if value else 0
+            b = (self.port & ~I2C_BL) | self.bl
+            self.send(&b, 1)
+
+    cdef void send(self, const unsigned char* buf, Py_ssize_t n) noexcept nogil:
+        """Sends raw bytes to the PCF8574 which each set all 8 pins"""
+        cdef Py_ssize_t x
+        self.port = buf[n-1]
+        while n > 0:
+            x = unistd.write(self.fd, buf, n)
+            if x <= 0: return # nowhere to report the error, e.g. the backpack was unplugged
+            buf += x; n -= x
+
+    cdef void nibbleI2C(self, unsigned char x) noexcept nogil:
+        """Clocks in 4 bits as a command, only used during initialization"""
+        cdef unsigned char buf[3]
+        buf[0] = (x << 4) | self.bl
+        buf[1] = buf[0] | I2C_EN
+        buf[2] = buf[0]
+        self.send(buf, 3)
+
+    cdef Py_ssize_t encodeI2C(self, unsigned char* buf, const unsigned char* s, Py_ssize_t n,
+                              unsigned char rs) noexcept nogil:
+        """
+        Encodes bytes into the buffer as the pin changes to clock them in with RS given. The
+        buffer must have room for 4 bytes per byte plus 1. Returns the number of bytes used.
+        """
+        cdef unsigned char hi, lo, b = rs | self.bl
+        cdef Py_ssize_t i, j = 0
+        # RS and RW need to be set before EN goes high, data only needs to be set before it goes low
+        if (self.port & (I2C_RS | I2C_RW | I2C_EN)) != rs:
+            buf[0] = (self.port & 0xF0) | b; j = 1
+        for i in range(n):
+            hi = (s[i] & 0xF0) | b
+            lo = ((s[i] << 4) & 0xF0) | b
+            buf[j] = hi | I2C_EN; buf[j+1] = hi; buf[j+2] = lo | I2C_EN; buf[j+3] = lo
+            j += 4
+        return j
+
+    cdef int readI2C_(self, unsigned char rs) noexcept nogil:
+        """
+        Read a single byte from the LCD with RS given. The data pins are written high so that the
+        quasi-bidirectional port of the PCF8574 can be pulled low by the LCD.
+        """
+        cdef unsigned char hi = 0, lo = 0, b = 0xF0 | I2C_RW | rs | self.bl
+        cdef unsigned char buf[2]
+        buf[0] = b; buf[1] = b | I2C_EN
+        self.send(buf, 2)
+        if unistd.read(self.fd, &hi, 1) != 1: hi = 0
+        buf[0] = b; buf[1] = b | I2C_EN
+        self.send(buf, 2)
+        if unistd.read(self.fd, &lo, 1) != 1: lo = 0
+        self.send(&b, 1)
+        return (hi & 0xF0) | (lo >> 4)
+
+    cdef inline void waitI2C(self) noexcept nogil:
+        """Waits for the LCD to not be busy"""
+        while self.readI2C_(0) & 0x80: pass
+
+    @property
+    def busy(self):
+        cdef int x
+        with self.lock, nogil: x = self.readI2C_(0)
+        return (x & 0x80) != 0
+
+    cdef int readI2C(self) noexcept nogil:
+        """Read a single byte from the LCD, the character address"""
+        return self.readI2C_(0)
+    cdef int readDataI2C(self) noexcept nogil:
+        """Read a single byte from the LCD, the data"""
+        return self.readI2C_(I2C_RS)
+
+    cdef void writeI2C(self, unsigned char x) noexcept nogil:
+        """
+        Writes a single byte to the LCD as a command. The I2C bus is slow enough that the LCD is
+        never busy for the next command except after clearing or returning home.
+        """
+        cdef unsigned char buf[5]
+        self.send(buf, self.encodeI2C(buf, &x, 1, 0))
+        if x <= 0x03: self.waitI2C()
+    cdef void writeDataI2C(self, unsigned char x) noexcept nogil:
+        """Writes a single byte to the LCD as data"""
+        cdef unsigned char buf[5]
+        self.send(buf, self.encodeI2C(buf, &x, 1, I2C_RS))
+    cdef void writeDataNI2C(self, const unsigned char* s, Py_ssize_t n) noexcept nogil:
+        """Writes several bytes to the LCD as data with as few writes to the bus as possible"""
+        cdef unsigned char buf[I2C_BUF_SIZE]
+        cdef Py_ssize_t m
+        while n > 0:
+            m = min(n, (I2C_BUF_SIZE - 1) // 4)
+            self.send(buf, self.encodeI2C(buf, s, m, I2C_RS))
+            s += m; n -= m
+
+
+def throughput(LCD lcd, int n=1000):
+    """
+    Measures the throughput of writing to the LCD in characters per second by writing n
+    characters to the first line. This overwrites the contents of the display.
+    """
+    from time import perf_counter
+    line = (b'0123456789ABCDEFGHIJ' * 4)[:lcd.nc]
+    cdef int count = (n + lcd.nc - 1) // lcd.nc
+    start = perf_counter()
+    for _ in range(count): lcd.write_at((0, 0), line)
+    return count * lcd.nc / (perf_counter() - start)
@@ -3,9 +3,11 @@
 Helpers for useing the LCD library. In general these are all specific to my setup and devices.
 """
 
+import os, json
+
 from . import lcd
 
-__all__ = ["lcd_setup", "set_contrast", "set_backlight", "beep", "as_bytes"]
+__all__ = ["lcd_setup", "calibrate", "set_contrast", "set_backlight", "beep", "as_bytes"]
 
 # BCM #:      # wiringPi #:
 BEEP_PIN = 27 # 2
@@ -16,6 +18,7 @@ RW_PIN = 3    # 9
 EN_PIN = 4    # 7
 DB_PINS = (17, 18, 15, 14) # (0, 1, 16, 15)
 LCD_DIM = (20, 2)
+TIMING_PROFILE = '/var/lib/lego-lcd/timing.json' # created by calibrate()
 ASCII_TRANS = {
     # Pass-through of custom characters
     '\x00':'\x00', '\x01':b'\x01', '\x02':b'\x02', '\x03':b'\x03', '\x04':b'\x04', '\x05':b'\x05', '\x06':b'\x06', '\x07':b'\x07',
@@ -124,14 +127,34 @@ LCD_TRANS = {
 LCD_TRANS.update(ASCII_TRANS)
 
 
-def lcd_setup(ct=None, bl=None):
-    """Setup the LCD and other GPIO items. Returns the LCD object."""
+def lcd_setup(ct=None, bl=None, timing_profile=TIMING_PROFILE):
+    """
+    Setup the LCD and other GPIO items. Returns the LCD object. If the timing profile file exists,
+    the LCD uses the timings in it, otherwise the default timings are used.
+    """
     lcd.wiringPiSetupGpio()
     lcd.pinMode(CT_PIN, lcd.PWM_OUTPUT)
     if ct is not None: set_contrast(ct)
     lcd.pinMode(BL_PIN, lcd.PWM_OUTPUT)
     if bl is not None: set_backlight(bl)
-    return lcd.LCD(RS_PIN, RW_PIN, EN_PIN, DB_PINS, LCD_DIM)
+    timing = None
+    if timing_profile is not None and os.path.exists(timing_profile):
+        with open(timing_profile) as f: timing = json.load(f)
+    return lcd.LCD(RS_PIN, RW_PIN, EN_PIN, DB_PINS, LCD_DIM, timing)
+
+def calibrate(timing_profile=TIMING_PROFILE):
+    """
+    Calibrates the bus timings of the LCD starting from the default timings and saves the profile
+    so that lcd_setup() uses it. Returns the profile along with the throughput (in characters per
+    second) before and after.
+    """
+    display = lcd_setup(timing_profile=None)
+    before = lcd.throughput(display)
+    profile = display.calibrate_timing()
+    after = lcd.throughput(display)
+    os.makedirs(os.path.dirname(timing_profile), exist_ok=True)
+    with open(timing_profile, 'w') as f: json.dump(profile, f)
+    return profile, before, after
 
 def set_contrast(ct):
     """Sets the LCD contrast amount, ct is a value from 0.0 to 1.0"""
@@ -96,25 +96,36 @@ def stop_connection(name: str = GENERIC_CONNECTION_NAME) -> str|None:
     return ssid
 
 
+def __strongest_access_point_path(devices: list[NetworkDeviceWireless], ssid: bytes) -> str|None:
+    """Get the object path of the strongest access point already known with the given SSID."""
+    found_path = None
+    found_strength = -1
+    for dev in devices:
+        for ap_path in dev.get_all_access_points():
+            ap = NMAccessPoint(ap_path)
+            # If the SSID matches and the strength is greater than the last found, update the path
+            if ap.ssid == ssid and found_strength < ap.strength:
+                found_path = ap_path
+                found_strength = ap.strength
+    return found_path
+
+
 def get_access_point_path(ssid: str) -> str|None:
-    """Get the specific object path for an access point with the given SSID."""
+    """
+    Get the specific object path for an access point with the given SSID. A scan for the SSID is
+    only done if NetworkManager doesn't already know about an access point with it.
+    """
     __ensure_system_bus()
     ssid = ssid.encode('ascii')
-    options = {'ssids': ('aay', [ssid])}
     devices = __all_wifi_devices()
+    found_path = __strongest_access_point_path(devices, ssid)
+    if found_path is not None: return found_path
+    options = {'ssids': ('aay', [ssid])}
     for dev in devices: dev.request_scan(options)
     sleep(0.5)  # right after the scan wait a little longer
     for tries in range(9):  # up to ~5 seconds of trying
         sleep(0.5)
-        found_path = None
-        found_strength = -1
-        for dev in devices:
-            for ap_path in dev.get_all_access_points():
-                ap = NMAccessPoint(ap_path)
-                # If the SSID matches and the strength is greater than the last found, update the path
-                if ap.ssid == ssid and found_strength < ap.strength:
-                    found_path = ap_path
-                    found_strength = ap.strength
+        found_path = __strongest_access_point_path(devices, ssid)
         if found_path is not None:
             return found_path  # found one - stop trying
     return "/"  # never found one, return the "no specific path"
@@ -165,22 +176,69 @@ def connect_wifi(conn_info: dict, ap_path: str = "/") -> None:
     dev_path = __first_wifi_device_path()
     profile = ConnectionProfile.from_settings_dict(conn_info)
     NetworkManager().add_and_activate_connection(profile.to_dbus(), dev_path, ap_path)
+    __wait_for_activation(dev_path, conn_info['connection']['id'])
+
+
+def activate_wifi(conn_path: str, ap_path: str = "/") -> None:
+    """Activate an existing wifi connection using NetworkManager."""
+    __ensure_system_bus()
+    dev_path = __first_wifi_device_path()
+    NetworkManager().activate_connection(conn_path, dev_path, ap_path)
+    name = NetworkConnectionSettings(conn_path).get_settings()['connection']['id'][1]
+    __wait_for_activation(dev_path, name)
 
-    # Wait for the connection to activate
+
+def __wait_for_activation(dev_path: str, name: str) -> None:
+    """Wait for the connection to activate on the device."""
     loop_count = 0
     dev = NetworkDeviceWireless(dev_path)
     while dev.state != DeviceState.ACTIVATED:
         sleep(1)
         loop_count += 1
         if loop_count > 30: # only wait 30 seconds max
-            raise TimeoutError(f"Connection {conn_info['connection']['id']} failed to activate.")
+            raise TimeoutError(f"Connection {name} failed to activate.")
+
+
+def __saved_connection_path(name: str, conn_info: dict) -> str|None:
+    """
+    Get the path of the saved connection with the given name (if any), updating its settings if
+    they differ from the settings in conn_info (which is given the UUID of the saved connection).
+    """
+    paths = NetworkManagerSettings().get_connections_by_id(name)
+    if not paths: return None
+    conn = NetworkConnectionSettings(paths[0])
+    settings = conn.get_settings()
+    conn_info['connection']['uuid'] = settings['connection']['uuid'][1]
+    if not __settings_match(conn, settings, conn_info):
+        conn.update(ConnectionProfile.from_settings_dict(conn_info).to_dbus())
+    return paths[0]
+
+
+def __settings_match(conn: NetworkConnectionSettings, settings: dict, conn_info: dict) -> bool:
+    """
+    Check if the saved connection settings (as returned from get_settings()) have all of the
+    settings in conn_info, including the secrets, and no other security settings.
+    """
+    wanted = ConnectionProfile.from_settings_dict(conn_info).to_dbus()
+    security = {'802-11-wireless-security', '802-1x'}
+    if set(settings) & security != set(wanted) & security: return False
+    for name in set(wanted) & security:
+        try:
+            settings[name] |= conn.get_secrets(name).get(name, {})
+        except sdbus.SdBusBaseError:
+            return False  # no secrets available, they will be replaced
+    return all(key in settings.get(name, {}) and settings[name][key][1] == value[1]
+               for name, group in wanted.items() for key, value in group.items())
 
 
 def connect_to_ap(ssid: str, password: str|None = None, username: str|None = None,
                   hidden: bool = False, conn_name: str = GENERIC_CONNECTION_NAME) -> None:
     """
-    Connect to the given SSID with the given optional username and password.
+    Connect to the given SSID with the given optional username and password. If there is already a
+    saved connection with the name it is reused (after updating its settings if they changed) so
+    reconnecting only needs to activate it.
     """
+    __ensure_system_bus()
     ap_path = get_access_point_path(ssid)
     conn = __generic_connection_profile(conn_name, ssid)
     if hidden: conn['802-11-wireless']['hidden'] = True
@@ -206,7 +264,9 @@ def connect_to_ap(ssid: str, password: str|None = None, username: str|None = Non
             conn['802-11-wireless-security'] = {'auth-alg': 'open', 'key-mgmt': 'wpa-eap'}
             conn['802-1x'] |= {'eap': ['peap'], 'phase2-auth': 'mschapv2'}
 
-    connect_wifi(conn, ap_path)
+    conn_path = __saved_connection_path(conn_name, conn)
+    if conn_path is not None: activate_wifi(conn_path, ap_path)
+    else: connect_wifi(conn, ap_path)
 
 
 def __generic_connection_profile(name: str, ssid: str) -> dict:
@@ -0,0 +1,54 @@
+import os, socket, tempfile, threading, time, unittest
+
+from lego_lcd.display_server import DisplayServer, DisplayClient
+
+
+class FakeLCD:
+    """Records the text written to it like a 20x2 LCD."""
+    dims = (20, 2)
+    def __init__(self): self.rows = [bytearray(b' '*20) for _ in range(2)]
+    def clear(self): self.rows = [bytearray(b' '*20) for _ in range(2)]
+    def write_at(self, pos, s): self.rows[pos[0]][pos[1]:pos[1]+len(s)] = s
+    def set_custom_chars(self, *data, off=0): pass
+    def scrub(self, n=8): return 0
+
+
+class TestDisplayServer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'lcd.sock')
+        self.lcd = FakeLCD()
+        self.server = DisplayServer(self.lcd, self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def serve(self):
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def wait_for(self, condition, timeout=2.0):
+        end = time.monotonic() + timeout
+        while not condition() and time.monotonic() < end: time.sleep(0.01)
+        return condition()
+
+    def test_client_closing_before_greeting(self):
+        # Connect and close before the server accepts so sending the dimensions fails
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        sock.close()
+        thread = self.serve()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+
+        # Other clients can still use the display
+        with DisplayClient(self.path) as client:
+            self.assertEqual(client.dims, (20, 2))
+            client.write_at((0, 0), b'hello')
+            self.assertTrue(self.wait_for(lambda: self.lcd.rows[0].startswith(b'hello')))
+        self.assertTrue(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()